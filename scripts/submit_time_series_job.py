@@ -11,6 +11,7 @@ def bbox_to_wkt(min_lon: float, min_lat: float, max_lon: float, max_lat: float)
 def get_granules(
     path: int, start: str, end: str, min_lon: float, min_lat: float, max_lon: float, max_lat: float
 ) -> list[str]:
+    wkt = bbox_to_wkt(min_lon, min_lat, max_lon, max_lat)
     granules: list[str] = []
     for polarization in (asf_search.POLARIZATION.VV, asf_search.POLARIZATION.VV_VH):
         results = asf_search.geo_search(
@@ -21,7 +22,7 @@ def get_granules(
             relativeOrbit=path,
             start=start,
             end=end,
-            intersectsWith=bbox_to_wkt(min_lon, min_lat, max_lon, max_lat),
+            intersectsWith=wkt,
         )
         granules.extend(result.properties['sceneName'] for result in results)
     return granules
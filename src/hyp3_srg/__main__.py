@@ -1,6 +1,7 @@
 """HyP3 plugin for Stanford Radar Group (SRG) SAR Processor"""
 
 import argparse
+import logging
 import sys
 from importlib.metadata import entry_points
 
@@ -19,6 +20,9 @@ def main():
     )
 
     args, unknowns = parser.parse_known_args()
+
+    logging.basicConfig(stream=sys.stdout, format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+
     process_entry_point = list(entry_points(group='hyp3', name=args.process))[0]
 
     sys.argv = [args.process, *unknowns]
@@ -1,19 +1,28 @@
 """GSLC back-projection processing"""
 
 import argparse
+import fnmatch
 import logging
 import os
+import re
+import shutil
+import tempfile
 import zipfile
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from hyp3lib.aws import upload_file_to_s3
-from shapely import unary_union
+import shapely
+from shapely.geometry.base import BaseGeometry
 
 from hyp3_srg import dem, utils
 
 
 log = logging.getLogger(__name__)
+REQUIRED_FILES = ['elevation.dem', 'elevation.dem.rsc', 'params']
+CLEANUP_PATTERN = re.compile('|'.join(fnmatch.translate(p) for p in ['*hgt*', 'dem*', 'DEM*', 'q*', '*positionburst*']))
+# Per-granule outputs that merge_slcs.py and create_product consume; everything else in a scene directory is discarded
+SCENE_OUTPUT_PATTERN = re.compile('|'.join(fnmatch.translate(p) for p in ['S1*.geo', 'S1*.orbtiming']))
 
 
 def check_required_files(required_files: Iterable, work_dir: Path) -> None:
@@ -23,29 +32,115 @@ def check_required_files(required_files: Iterable, work_dir: Path) -> None:
 
 
 def clean_up_after_back_projection(work_dir: Path) -> None:
-    patterns = ['*hgt*', 'dem*', 'DEM*', 'q*', '*positionburst*']
-    for pattern in patterns:
-        for f in work_dir.glob(pattern):
-            f.unlink()
+    with os.scandir(work_dir) as entries:
+        for entry in entries:
+            if not entry.name.startswith('.') and CLEANUP_PATTERN.match(entry.name):
+                os.unlink(entry.path)
 
 
-def back_project_granules(granule_orbit_pairs: Iterable, work_dir: Path, gpu: bool = False) -> None:
+def download_granules(
+    granules: Iterable[str], work_dir: Path, max_workers: int = 8
+) -> tuple[list[tuple[Path, Path]], list[BaseGeometry]]:
+    """Download Sentinel-1 level-0 granules and their orbit files concurrently.
+
+    Args:
+        granules: List of Sentinel-1 level-0 granules to download
+        work_dir: Working directory for processing
+        max_workers: Maximum number of granules to download at once
+
+    Returns:
+        List of tuples of granule and orbit file paths, and the list of granule extents, both in input order
+    """
+    granules = list(granules)
+    session = utils.get_earthdata_session()
+    search_results = utils.search_raw_granules(granules)
+
+    # Orbit files are submitted as their own tasks so they download alongside the much larger granules
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (
+                executor.submit(
+                    utils.download_raw_granule,
+                    granule,
+                    work_dir,
+                    unzip=True,
+                    session=session,
+                    result=search_results[granule],
+                ),
+                executor.submit(utils.download_orbit, granule, work_dir),
+            )
+            for granule in granules
+        ]
+        results = [(granule_future.result(), orbit_future.result()) for granule_future, orbit_future in futures]
+
+    granule_orbit_pairs = [(granule_path, orbit_path) for (granule_path, _), orbit_path in results]
+    bboxs = [granule_bbox for (_, granule_bbox), _ in results]
+    return granule_orbit_pairs, bboxs
+
+
+def back_project_granule_in_scene_dir(cmd: str, granule_path: Path, orbit_path: Path, work_dir: Path) -> None:
+    """Back-project a single granule in its own scene directory, then move its GSLC outputs up to the working directory.
+
+    Running each granule in a separate directory keeps concurrent runs from sharing intermediate files.
+
+    Args:
+        cmd: Stanford module to call
+        granule_path: Path to the granule
+        orbit_path: Path to the orbit file
+        work_dir: Working directory to create the scene directory in
+    """
+    # A uniquely named directory keeps scene directories left behind by a failed run from blocking a retry
+    scene_dir = Path(tempfile.mkdtemp(dir=work_dir, prefix='scene_'))
+    for file in REQUIRED_FILES:
+        (scene_dir / file).symlink_to((work_dir / file).resolve())
+
+    args = [str(granule_path.resolve().with_suffix('')), str(orbit_path.resolve())]
+    utils.call_stanford_module(cmd, args, work_dir=scene_dir)
+
+    for output in scene_dir.iterdir():
+        if not SCENE_OUTPUT_PATTERN.match(output.name):
+            continue
+        if (work_dir / output.name).exists():
+            raise FileExistsError(f'Back-projection output {output.name} already exists in {work_dir}')
+        output.rename(work_dir / output.name)
+    shutil.rmtree(scene_dir)
+
+
+def back_project_granules(
+    granule_orbit_pairs: Iterable, work_dir: Path, gpu: bool = False, max_workers: int = 1
+) -> None:
     """Back-project a set of Sentinel-1 level-0 granules using the CPU-based workflow.
 
     Args:
         granule_orbit_pairs: List of tuples of granule and orbit file paths
         work_dir: Working directory for processing
+        gpu: Use the GPU-based version of the workflow
+        max_workers: Maximum number of granules to back-project at once (the GPU-based workflow uses one)
     """
-    check_required_files(['elevation.dem', 'elevation.dem.rsc', 'params'], work_dir)
+    check_required_files(REQUIRED_FILES, work_dir)
 
     if gpu:
         os.environ['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID'
         os.environ['CUDA_VISIBLE_DEVICES'] = '0'
+        if max_workers > 1:
+            # Every run would be pinned to the same GPU
+            log.warning('The GPU-based workflow back-projects one granule at a time; ignoring max_workers')
+            max_workers = 1
 
     cmd = 'sentinel/sentinel_scene_multigpu.py' if gpu else 'sentinel/sentinel_scene_cpu.py'
-    for granule_path, orbit_path in granule_orbit_pairs:
-        args = [str(granule_path.with_suffix('')), str(orbit_path)]
-        utils.call_stanford_module(cmd, args, work_dir=work_dir)
+    if max_workers == 1:
+        for granule_path, orbit_path in granule_orbit_pairs:
+            args = [str(granule_path.with_suffix('')), str(orbit_path)]
+            utils.call_stanford_module(cmd, args, work_dir=work_dir)
+    else:
+        # The Stanford modules run as subprocesses, so threads are enough to run them in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(back_project_granule_in_scene_dir, cmd, granule_path, orbit_path, work_dir)
+                for granule_path, orbit_path in granule_orbit_pairs
+            ]
+            for future in futures:
+                future.result()
 
     clean_up_after_back_projection(work_dir)
 
@@ -60,7 +155,18 @@ def create_product(work_dir) -> Path:
     Returns:
         Path to the created zip file
     """
-    gslc_path = list(work_dir.glob('S1*.geo'))[0]
+    gslc_paths = []
+    input_granules = []
+    with os.scandir(work_dir) as entries:
+        for entry in entries:
+            if not entry.name.startswith('S1'):
+                continue
+            if entry.name.endswith('.geo'):
+                gslc_paths.append(Path(entry.path))
+            elif entry.name.endswith('.SAFE'):
+                input_granules.append(entry.name.removesuffix('.SAFE'))
+
+    gslc_path = gslc_paths[0]
     product_name = gslc_path.with_suffix('').name
     orbit_path = work_dir / f'{product_name}.orbtiming'
     rsc_path = work_dir / 'elevation.dem.rsc'
@@ -68,18 +174,15 @@ def create_product(work_dir) -> Path:
     zip_path = work_dir / f'{product_name}.zip'
 
     parameter_file = work_dir / f'{product_name}.txt'
-    input_granules = [x.with_suffix('').name for x in work_dir.glob('S1*.SAFE')]
     with open(parameter_file, 'w') as f:
         f.write('Process: back-projection\n')
         f.write(f'Input Granules: {", ".join(input_granules)}\n')
 
-    # We don't compress the data because SLC data is psuedo-random
+    # We don't compress the data because SLC data is psuedo-random, but the small text files compress well
     with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as z:
-        z.write(gslc_path, gslc_path.name)
-        z.write(orbit_path, orbit_path.name)
-        z.write(rsc_path, rsc_path.name)
-        z.write(bounds_path, bounds_path.name)
-        z.write(parameter_file, parameter_file.name)
+        utils.add_file_to_zip(z, gslc_path)
+        for path in [orbit_path, rsc_path, bounds_path, parameter_file]:
+            utils.add_file_to_zip(z, path, compress_type=zipfile.ZIP_DEFLATED)
 
     return zip_path
 
@@ -93,7 +196,9 @@ def back_project(
     bucket_prefix: str = '',
     use_gslc_prefix: bool = False,
     work_dir: Path | None = None,
-    gpu: bool = False,
+    gpu: bool | None = None,
+    download_workers: int = 8,
+    processing_workers: int = 1,
 ):
     """Back-project a set of Sentinel-1 level-0 granules.
 
@@ -106,7 +211,9 @@ def back_project(
         bucket_prefix: Add a bucket prefix to the product(s)
         use_gslc_prefix: Upload GSLCs to a subprefix
         work_dir: Working directory for processing
-        gpu: Use the GPU-based version of the workflow
+        gpu: Use the GPU-based version of the workflow (defaults to using it if a GPU is available)
+        download_workers: Maximum number of granules to download at once
+        processing_workers: Maximum number of granules to back-project at once
     """
     if use_gslc_prefix:
         if not (bucket and bucket_prefix):
@@ -117,30 +224,29 @@ def back_project(
     if work_dir is None:
         work_dir = Path.cwd()
 
-    print('Downloading data...')
-    bboxs = []
-    granule_orbit_pairs = []
-    for granule in granules:
-        granule_path, granule_bbox = utils.download_raw_granule(granule, work_dir, unzip=True)
-        orbit_path = utils.download_orbit(granule, work_dir)
-        bboxs.append(granule_bbox)
-        granule_orbit_pairs.append((granule_path, orbit_path))
+    log.info('Downloading data...')
+    granule_orbit_pairs, bboxs = download_granules(granules, work_dir, max_workers=download_workers)
 
     if bounds is None:
-        bounds = list(unary_union(bboxs).buffer(0.1).bounds)
+        min_lon, min_lat, max_lon, max_lat = shapely.total_bounds(bboxs).tolist()
+        bounds = [min_lon - 0.1, min_lat - 0.1, max_lon + 0.1, max_lat + 0.1]
 
     dem_path = dem.download_dem_for_srg(bounds, work_dir)
     utils.create_param_file(dem_path, dem_path.with_suffix('.dem.rsc'), work_dir)
 
-    back_project_granules(granule_orbit_pairs, work_dir=work_dir, gpu=gpu)
+    if gpu is None:
+        gpu = utils.gpu_available()
+        log.info(f'Using the {"GPU" if gpu else "CPU"}-based version of the workflow')
+
+    back_project_granules(granule_orbit_pairs, work_dir=work_dir, gpu=gpu, max_workers=processing_workers)
 
     utils.call_stanford_module('util/merge_slcs.py', work_dir=work_dir)
 
     zip_path = create_product(work_dir)
     if bucket:
-        upload_file_to_s3(zip_path, bucket, bucket_prefix)
+        utils.upload_file_to_s3(zip_path, bucket, bucket_prefix)
 
-    print(f'Finished back-projection for {list(work_dir.glob("S1*.geo"))[0].with_suffix("").name}!')
+    log.info(f'Finished back-projection for {zip_path.stem}!')
 
 
 def main():
@@ -166,9 +272,25 @@ def main():
     )
     parser.add_argument(
         '--gpu',
-        default=False,
-        action='store_true',
-        help='Use the GPU-based version of the workflow.',
+        default=None,
+        action=argparse.BooleanOptionalAction,
+        help='Use the GPU-based version of the workflow. Defaults to using it if a GPU is available.',
+    )
+    parser.add_argument(
+        '--download-workers',
+        default=8,
+        type=int,
+        help='Maximum number of granules to download at once.',
+    )
+    parser.add_argument(
+        '--processing-workers',
+        default=1,
+        type=int,
+        help=(
+            'Maximum number of granules to back-project at once. Each Stanford module run is already multithreaded,'
+            ' so only increase this if the granules cannot keep every CPU busy on their own.'
+            ' Ignored by the GPU-based workflow, which back-projects one granule at a time.'
+        ),
     )
     parser.add_argument(
         '--bounds',
@@ -185,6 +307,11 @@ def main():
     )
     args = parser.parse_args()
 
+    if args.download_workers < 1:
+        parser.error('--download-workers must be a positive integer.')
+    if args.processing_workers < 1:
+        parser.error('--processing-workers must be a positive integer.')
+
     args.granules = [item for sublist in args.granules for item in sublist]
 
     if args.bounds is not None:
@@ -1,35 +1,150 @@
 """Prepare a Copernicus GLO-30 DEM virtual raster (VRT) covering a given geometry"""
 
 import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from hyp3_srg import utils
 
 
 log = logging.getLogger(__name__)
+DEM_CACHE_ENV_VAR = 'HYP3_SRG_DEM_CACHE'
+DEM_FILES = ['elevation.dem', 'elevation.dem.rsc']
+EGM_URL = 'https://lavas-data.s3.us-west-2.amazonaws.com/egm2008_geoid_grid'
+EGM_PART_SIZE = 16 * 1024 * 1024
+EGM_DOWNLOAD_WORKERS = 8
+
+
+def download_byte_range(session: requests.Session, url: str, path: Path, start: int, end: int) -> None:
+    """Download a byte range of a file into the same position of an existing local file.
+
+    Args:
+        session: Session to make the request with
+        url: URL of the file to download
+        path: Path to the local file to write into
+        start: First byte of the range
+        end: Last byte of the range (inclusive)
+    """
+    with session.get(url, headers={'Range': f'bytes={start}-{end}'}, stream=True) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise ValueError(f'{url} does not support byte range requests')
+        with open(path, 'r+b') as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size=utils.COPY_BUFFER_SIZE):
+                f.write(chunk)
 
 
 def ensure_egm_model_available():
     """Ensure the EGM module is available.
     Currently using the EGM2004 model provided by Stanford, but hope to switch to a public source.
-    """
-    url = 'https://lavas-data.s3.us-west-2.amazonaws.com/egm2008_geoid_grid'
 
+    The model is only downloaded if the local copy is missing or a different size,
+    and is then fetched as parallel byte ranges.
+    """
     proc_home = utils.get_proc_home()
     egm_model_path = proc_home / 'DEM' / 'egm2008_geoid_grid'
 
-    with requests.get(url, stream=True) as r:
-        r.raise_for_status()
-        with open(egm_model_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    # One connection pool is shared by the HEAD request and every range request
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(pool_maxsize=EGM_DOWNLOAD_WORKERS))
+
+        response = session.head(EGM_URL)
+        response.raise_for_status()
+        size = int(response.headers['Content-Length'])
+        if egm_model_path.exists() and egm_model_path.stat().st_size == size:
+            return
+
+        # A unique temporary file keeps concurrent runs sharing PROC_HOME from writing into each other's downloads
+        fd, tmp_name = tempfile.mkstemp(dir=egm_model_path.parent, prefix=f'.{egm_model_path.name}.')
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.truncate(size)
+
+            with ThreadPoolExecutor(max_workers=EGM_DOWNLOAD_WORKERS) as executor:
+                futures = [
+                    executor.submit(
+                        download_byte_range, session, EGM_URL, tmp_path, start, min(start + EGM_PART_SIZE, size) - 1
+                    )
+                    for start in range(0, size, EGM_PART_SIZE)
+                ]
+                for future in futures:
+                    future.result()
+
+            tmp_path.chmod(0o644)
+            os.replace(tmp_path, egm_model_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+
+def create_dem(bounds: list[float], output_dir: Path) -> None:
+    """Create a DEM for the given bounds using the Stanford DEM module.
+
+    Args:
+        bounds: The bounds of the extent of the desired DEM - [min_lon, min_lat, max_lon, max_lat].
+        output_dir: The directory to create the DEM in
+    """
+    ensure_egm_model_available()
+
+    min_lon, min_lat, max_lon, max_lat = bounds
+    dem_files = [str(output_dir / 'elevation.dem'), str(output_dir / 'elevation.dem.rsc')]
+    args = [*dem_files, max_lat, min_lat, min_lon, max_lon, '6', '2']
+    utils.call_stanford_module('DEM/createDEMcop.py', args, work_dir=output_dir)
+
+
+def get_cached_dem(bounds: list[float], cache_dir: Path) -> Path:
+    """Get the directory of a cached DEM for the given bounds, creating it if it isn't cached yet.
+
+    New DEMs are created in a temporary directory and renamed into place, so concurrent runs never see a partial DEM.
+
+    Args:
+        bounds: The bounds of the extent of the desired DEM - [min_lon, min_lat, max_lon, max_lat].
+        cache_dir: The root directory of the DEM cache
+
+    Returns:
+        The directory containing the cached DEM files
+    """
+    dem_dir = cache_dir / ('_'.join(str(bound) for bound in bounds) + '_6x2')
+    if dem_dir.exists():
+        log.info(f'Using cached DEM in {dem_dir}')
+        return dem_dir
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=cache_dir, prefix='.tmp_'))
+    try:
+        create_dem(bounds, tmp_dir)
+        for path in tmp_dir.iterdir():
+            if path.name in DEM_FILES:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        # mkdtemp creates the directory as 0700, which would hide the cache entry from other users of the volume
+        tmp_dir.chmod(0o755)
+        try:
+            tmp_dir.rename(dem_dir)
+        except OSError:
+            if not dem_dir.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return dem_dir
 
 
 def download_dem_for_srg(bounds: list[float], work_dir: Path):
     """Download the DEM for the given bounds - [min_lon, min_lat, max_lon, max_lat].
 
+    If the HYP3_SRG_DEM_CACHE environment variable is set, the DEM is reused from (or added to) the cache in that
+    directory and symlinked into the working directory.
+
     Args:
         bounds: The bounds of the extent of the desired DEM - [min_lon, min_lat, max_lon, max_lat].
         work_dir: The directory to save the DEM in
@@ -42,15 +157,19 @@ def download_dem_for_srg(bounds: list[float], work_dir: Path):
             'Improper bounding box formatting, should be [max latitude, min latitude, min longitude, max longitude].'
         )
 
-    dem_path = work_dir / 'elevation.dem'
-    dem_rsc = work_dir / 'elevation.dem.rsc'
-
     with open(work_dir / 'bounds', 'w') as bounds_file:
         bounds_file.write(' '.join([str(bound) for bound in bounds]))
 
-    ensure_egm_model_available()
+    # Existing DEM files may be symlinks into the cache, which must not be written through
+    for name in DEM_FILES:
+        (work_dir / name).unlink(missing_ok=True)
+
+    cache_dir = os.environ.get(DEM_CACHE_ENV_VAR)
+    if cache_dir:
+        dem_dir = get_cached_dem(bounds, Path(cache_dir))
+        for name in DEM_FILES:
+            (work_dir / name).symlink_to((dem_dir / name).resolve())
+    else:
+        create_dem(bounds, work_dir)
 
-    stanford_bounds = [bounds[i] for i in [3, 1, 0, 2]]
-    args = [str(dem_path), str(dem_rsc), *stanford_bounds, '6', '2']
-    utils.call_stanford_module('DEM/createDEMcop.py', args, work_dir=work_dir)
-    return dem_path
+    return work_dir / 'elevation.dem'
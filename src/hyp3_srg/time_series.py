@@ -2,20 +2,23 @@
 
 import argparse
 import logging
+import re
 import shutil
+import zipfile
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from os import mkdir
 from pathlib import Path
 from secrets import token_hex
-from shutil import copyfile
 
-from hyp3lib.aws import upload_file_to_s3
 from hyp3lib.fetch import download_file as download_from_http
 
 from hyp3_srg import dem, utils
 
 
 log = logging.getLogger(__name__)
+RSC_SIZE_PATTERN = re.compile(r'^\s*(WIDTH|FILE_LENGTH)\s+(\S+)', re.MULTILINE)
+GSLC_KEY_PATTERN = re.compile(r'(^|/)S1[^/]*\.zip$')
 
 
 def get_gslc_uris_from_s3(bucket: str, prefix: str = '') -> list[str]:
@@ -28,42 +31,81 @@ def get_gslc_uris_from_s3(bucket: str, prefix: str = '') -> list[str]:
     Returns:
         uris: a list of uris to the zip files
     """
-    res = utils.s3_list_objects(bucket, prefix)
-    keys = [item['Key'] for item in res['Contents']]
-    uris = ['/'.join(['s3://' + bucket, key]) for key in keys]
+    keys = [item['Key'] for item in utils.s3_list_objects(bucket, prefix)]
+    uris = [f's3://{bucket}/{key}' for key in keys if GSLC_KEY_PATTERN.search(key)]
     return uris
 
 
-def load_products(uris: Iterable[str], overwrite: bool = False):
+def fetch_product(uri: str, work_dir: Path, overwrite: bool = False) -> bool:
+    """Fetch a product zip from S3, HTTP, or a local path into the working directory
+
+    Args:
+        uri: URI to the SRG GSLC product
+        work_dir: directory to fetch the product into
+        overwrite: overwrite existing products
+
+    Returns:
+        fetched: whether the product zip was fetched into the working directory by this call
+    """
+    name = Path(Path(uri).name)
+    product_exists = (work_dir / name.with_suffix('.geo')).exists() or (work_dir / name.with_suffix('.zip')).exists()
+    if product_exists and not overwrite:
+        return False
+    elif uri.startswith('s3'):
+        utils.download_from_s3(uri, dest_dir=work_dir)
+    elif uri.startswith('http'):
+        download_from_http(uri, directory=work_dir)
+    elif len(Path(uri).parts) > 1:
+        shutil.copy(uri, work_dir)
+    else:
+        return False
+    return True
+
+
+def load_product(uri: str, work_dir: Path, overwrite: bool = False) -> str:
+    """Fetch and unpack a product into the working directory
+
+    Product zips fetched by this function are deleted once they've been unpacked.
+
+    Args:
+        uri: URI to the SRG GSLC product
+        work_dir: directory to load the product into
+        overwrite: overwrite existing products
+
+    Returns:
+        name: the product name
+    """
+    name = Path(Path(uri).name)
+    zip_path = work_dir / name.with_suffix('.zip')
+    fetched = fetch_product(uri, work_dir, overwrite)
+    if fetched or not (work_dir / name.with_suffix('.geo')).exists():
+        utils.extract_zip(zip_path, work_dir)
+    if fetched:
+        zip_path.unlink()
+    return str(name)
+
+
+def load_products(uris: Iterable[str], overwrite: bool = False, max_workers: int = 8):
     """Load the products from the provided URIs
 
+    Each product is unpacked as soon as it has been fetched, so unpacking overlaps the remaining downloads.
+
     Args:
         uris: list of URIs to the SRG GSLC products
         overwrite: overwrite existing products
+        max_workers: maximum number of products to load at once
     """
     work_dir = Path.cwd()
-    granule_names = []
-    for uri in uris:
-        name = Path(Path(uri).name)
-        geo_name = name.with_suffix('.geo')
-        zip_name = name.with_suffix('.zip')
-
-        product_exists = geo_name.exists() or zip_name.exists()
-        if product_exists and not overwrite:
-            pass
-        elif uri.startswith('s3'):
-            utils.download_from_s3(uri, dest_dir=work_dir)
-        elif uri.startswith('http'):
-            download_from_http(uri, directory=work_dir)
-        elif len(Path(uri).parts) > 1:
-            shutil.copy(uri, work_dir)
+    uris = list(uris)
 
-        if not geo_name.exists():
-            shutil.unpack_archive(name.with_suffix('.zip'), work_dir)
-
-        granule_names.append(str(name))
+    # URIs sharing a file name would fetch and unpack into the same paths, so only the first of each is loaded
+    unique_uris: dict[str, str] = {}
+    for uri in uris:
+        unique_uris.setdefault(Path(uri).name, uri)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda uri: load_product(uri, work_dir, overwrite), unique_uris.values()))
 
-    return granule_names
+    return [Path(uri).name for uri in uris]
 
 
 def get_size_from_dem(dem_path: str) -> tuple[int, int]:
@@ -75,13 +117,8 @@ def get_size_from_dem(dem_path: str) -> tuple[int, int]:
     Returns:
         dem_width, dem_length: tuple containing the dem width and dem length
     """
-    with open(dem_path) as dem_file:
-        width_line = dem_file.readline()
-        dem_width = width_line.split()[1]
-        length_line = dem_file.readline()
-        dem_length = length_line.split()[1]
-
-    return int(dem_width), int(dem_length)
+    rsc = dict(RSC_SIZE_PATTERN.findall(Path(dem_path).read_text()))
+    return int(rsc['WIDTH']), int(rsc['FILE_LENGTH'])
 
 
 def generate_wrapped_interferograms(
@@ -160,8 +197,8 @@ def compute_sbas_velocity_solution(
     unw_width, unw_length = unw_shape
 
     utils.call_stanford_module('sbas/sbas_setup.py', args=['sbas_list', 'geolist'], work_dir=work_dir)
-    copyfile(work_dir / 'intlist', work_dir / 'unwlist')
-    utils.call_stanford_module('util/sed.py', args=['s/int/unw/g', 'unwlist'], work_dir=work_dir)
+    intlist = (work_dir / 'intlist').read_text()
+    (work_dir / 'unwlist').write_text(intlist.replace('int', 'unw'))
 
     ref_point_args = ['unwlist', unw_width, unw_length, threshold]
     utils.call_stanford_module('int/findrefpoints', args=ref_point_args, work_dir=work_dir)
@@ -171,10 +208,10 @@ def compute_sbas_velocity_solution(
         utils.call_stanford_module('int/tropocorrect.py', args=tropo_correct_args, work_dir=work_dir)
 
     with open(work_dir / 'unwlist') as unw_list:
-        num_unw_files = len(unw_list.readlines())
+        num_unw_files = sum(1 for _ in unw_list)
 
     with open(work_dir / 'geolist') as slc_list:
-        num_slcs = len(slc_list.readlines())
+        num_slcs = sum(1 for _ in slc_list)
 
     sbas_velocity_args = ['unwlist', num_unw_files, num_slcs, unw_width, 'ref_locs']
     utils.call_stanford_module('sbas/sbas', args=sbas_velocity_args, work_dir=work_dir)
@@ -224,23 +261,23 @@ def create_time_series_product_name(
         the product name as a string.
     """
     prefix = 'S1_SRG_SBAS'
-    split_names = [granule.split('_') for granule in granule_names]
+    first_granule = granule_names[0].split('_')
 
-    absolute_orbit = split_names[0][7]
-    if split_names[0][0] == 'S1A':
+    absolute_orbit = first_granule[7]
+    if first_granule[0] == 'S1A':
         relative_orbit = str(((int(absolute_orbit) - 73) % 175) + 1)
     else:
         relative_orbit = str(((int(absolute_orbit) - 27) % 175) + 1)
 
-    start_dates = sorted([name[5] for name in split_names])
+    start_dates = sorted(granule.split('_')[5] for granule in granule_names)
     earliest_granule = start_dates[0]
     latest_granule = start_dates[-1]
 
     def lat_string(lat):
-        return ('N' if lat >= 0 else 'S') + f'{("%.1f" % abs(lat)).zfill(4)}'.replace('.', '_')  # noqa: UP031
+        return f'{"N" if lat >= 0 else "S"}{abs(lat):04.1f}'.replace('.', '_')
 
     def lon_string(lon):
-        return ('E' if lon >= 0 else 'W') + f'{("%.1f" % abs(lon)).zfill(5)}'.replace('.', '_')  # noqa: UP031
+        return f'{"E" if lon >= 0 else "W"}{abs(lon):05.1f}'.replace('.', '_')
 
     return '_'.join(
         [
@@ -272,27 +309,17 @@ def package_time_series(granules: list[str], bounds: list[float], work_dir: Path
         work_dir = Path.cwd()
     sbas_dir = work_dir / 'sbas'
     product_name = create_time_series_product_name(granules, bounds)
-    product_path = work_dir / product_name
-    product_path.mkdir(exist_ok=True, parents=True)
     zip_path = work_dir / f'{product_name}.zip'
 
-    to_keep = [
-        # Metadata
-        'sbas_list',
-        'parameters',
-        'ref_locs',
-        'dem.rsc',
-        # Datasets
-        'dem',
-        'locs',
-        'npts',
-        'displacement',
-        'stackmht',
-        'stacktime',
-        'velocity',
-    ]
-    [shutil.copy(sbas_dir / f, product_path / f) for f in to_keep]
-    shutil.make_archive(str(product_path), 'zip', product_path)
+    metadata = ['sbas_list', 'parameters', 'ref_locs', 'dem.rsc']
+    datasets = ['dem', 'locs', 'npts', 'displacement', 'stackmht', 'stacktime', 'velocity']
+
+    # The raster datasets are essentially incompressible floats, but the small text files compress well
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as z:
+        for name in metadata:
+            utils.add_file_to_zip(z, sbas_dir / name, compress_type=zipfile.ZIP_DEFLATED)
+        for name in datasets:
+            utils.add_file_to_zip(z, sbas_dir / name)
     return zip_path
 
 
@@ -329,6 +356,8 @@ def time_series(
         if not (bucket and bucket_prefix):
             raise ValueError('bucket and bucket_prefix must be given if use_gslc_prefix is True')
         granules = get_gslc_uris_from_s3(bucket, f'{bucket_prefix}/GSLC_granules')
+        if not granules:
+            raise ValueError(f'No GSLC products found under s3://{bucket}/{bucket_prefix}/GSLC_granules')
 
     granule_names = load_products(granules)
     dem_path = dem.download_dem_for_srg(bounds, work_dir)
@@ -340,9 +369,9 @@ def time_series(
 
     zip_path = package_time_series(granule_names, bounds, work_dir)
     if bucket:
-        upload_file_to_s3(zip_path, bucket, bucket_prefix)
+        utils.upload_file_to_s3(zip_path, bucket, bucket_prefix)
 
-    print(f'Finished time-series processing for {", ".join(granule_names)}!')
+    log.info(f'Finished time-series processing for {", ".join(granule_names)}!')
 
 
 def main():
@@ -1,21 +1,35 @@
+import functools
 import logging
 import netrc
 import os
+import shutil
 import subprocess
+from collections.abc import Iterable
 from pathlib import Path
 from platform import system
-from zipfile import ZipFile
+from urllib.parse import urlparse
+from zipfile import ZipFile, ZipInfo, is_zipfile
 
 import asf_search
 from boto3 import client
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from hyp3lib.aws import get_content_type, get_tag_set
 from s1_orbits import fetch_for_scene
 from shapely.geometry import shape
 from shapely.geometry.base import BaseGeometry
 
 
-S3 = client('s3')
+# Room for several concurrent multipart transfers, each using up to S3_TRANSFER_CONFIG.max_concurrency connections
+S3 = client('s3', config=Config(max_pool_connections=64))
 log = logging.getLogger(__name__)
 EARTHDATA_HOST = 'urs.earthdata.nasa.gov'
+_earthdata_credentials: tuple[str, str] | None = None
+COPY_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=64 * 1024 * 1024, multipart_chunksize=64 * 1024 * 1024, max_concurrency=8
+)
 
 
 def get_proc_home() -> Path:
@@ -57,6 +71,9 @@ def set_creds(service, username, password) -> None:
     if password is not None:
         os.environ[f'{service.upper()}_PASSWORD'] = password
 
+    global _earthdata_credentials
+    _earthdata_credentials = None
+
 
 def find_creds_in_env(username_name, password_name) -> tuple[str | None, str | None]:
     """Find credentials for a service in the environment.
@@ -68,14 +85,20 @@ def find_creds_in_env(username_name, password_name) -> tuple[str | None, str | N
     Returns:
         Tuple of the username and password found in the environment
     """
-    if username_name in os.environ and password_name in os.environ:
-        username = os.environ[username_name]
-        password = os.environ[password_name]
+    username = os.environ.get(username_name)
+    password = os.environ.get(password_name)
+    if username is not None and password is not None:
         return username, password
 
     return None, None
 
 
+@functools.lru_cache(maxsize=1)
+def _parse_netrc(netrc_file: Path, mtime_ns: int, size: int) -> netrc.netrc:
+    # mtime_ns and size are only part of the cache key, so an edited netrc file is parsed again
+    return netrc.netrc(netrc_file)
+
+
 def find_creds_in_netrc(service) -> tuple[str | None, str | None]:
     """Find credentials for a service in the netrc file.
 
@@ -87,7 +110,8 @@ def find_creds_in_netrc(service) -> tuple[str | None, str | None]:
     """
     netrc_file = get_netrc()
     if netrc_file.exists():
-        netrc_credentials = netrc.netrc(netrc_file)
+        netrc_stat = netrc_file.stat()
+        netrc_credentials = _parse_netrc(netrc_file, netrc_stat.st_mtime_ns, netrc_stat.st_size)
         if service in netrc_credentials.hosts:
             username = netrc_credentials.hosts[service][0]
             password = netrc_credentials.hosts[service][2]
@@ -99,16 +123,22 @@ def find_creds_in_netrc(service) -> tuple[str | None, str | None]:
 def get_earthdata_credentials() -> tuple[str, str]:
     """Get NASA EarthData credentials from the environment or netrc file.
 
+    The credentials are cached after the first successful lookup until `set_creds` is called again.
+
     Returns:
         Tuple of the NASA EarthData username and password
     """
+    global _earthdata_credentials
+    if _earthdata_credentials is not None:
+        return _earthdata_credentials
+
     username, password = find_creds_in_env('EARTHDATA_USERNAME', 'EARTHDATA_PASSWORD')
-    if username and password:
-        return username, password
+    if not (username and password):
+        username, password = find_creds_in_netrc(EARTHDATA_HOST)
 
-    username, password = find_creds_in_netrc(EARTHDATA_HOST)
     if username and password:
-        return username, password
+        _earthdata_credentials = username, password
+        return _earthdata_credentials
 
     raise ValueError(
         'Please provide NASA EarthData credentials via the '
@@ -116,7 +146,79 @@ def get_earthdata_credentials() -> tuple[str, str]:
     )
 
 
-def download_raw_granule(granule_name: str, output_dir: Path, unzip: bool = False) -> tuple[Path, BaseGeometry]:
+def get_earthdata_session() -> asf_search.ASFSession:
+    """Create an asf_search session authenticated with NASA EarthData credentials.
+
+    Returns:
+        Authenticated asf_search session
+    """
+    username, password = get_earthdata_credentials()
+    return asf_search.ASFSession().auth_with_creds(username, password)
+
+
+def search_raw_granules(granule_names: Iterable[str]) -> dict[str, asf_search.ASFProduct]:
+    """Find S1 level-0 granules with a single asf_search query.
+
+    Args:
+        granule_names: Names of the granules to find, with or without the `-RAW` suffix
+
+    Returns:
+        Dictionary mapping each granule name, as given, to its search result
+    """
+    file_ids = {name: name if name.endswith('-RAW') else f'{name}-RAW' for name in granule_names}
+    results = {result.properties['fileID']: result for result in asf_search.granule_search(list(file_ids.values()))}
+
+    missing = [name for name, file_id in file_ids.items() if file_id not in results]
+    if missing:
+        raise ValueError(f'Could not find granule(s): {", ".join(missing)}')
+
+    return {name: results[file_id] for name, file_id in file_ids.items()}
+
+
+def _strip_auth_if_aws(response, *args, **kwargs) -> None:
+    # Mirrors asf_search's download hook: S3 rejects requests that carry EarthData credentials on redirect
+    if 300 <= response.status_code <= 399 and 'amazonaws.com' in urlparse(response.headers['location']).netloc:
+        location = response.headers['location']
+        response.headers.clear()
+        response.headers['location'] = location
+
+
+def download_asf_product(result: asf_search.ASFProduct, output_dir: Path, session: asf_search.ASFSession) -> Path:
+    """Download an asf_search product using large, buffered reads and writes.
+
+    `ASFProduct.download` reads and writes in 8 KiB chunks, which throttles multi-GB granule downloads.
+    The product is written to a `.part` file and renamed once complete.
+
+    Args:
+        result: Search result for the product to download
+        output_dir: Directory to save the product in
+        session: Authenticated asf_search session
+
+    Returns:
+        Path to the downloaded product
+    """
+    out_path = output_dir / result.properties['fileName']
+    part_path = out_path.with_name(f'{out_path.name}.part')
+
+    with session.get(result.properties['url'], stream=True, hooks={'response': _strip_auth_if_aws}) as response:
+        if 400 <= response.status_code <= 499:
+            raise asf_search.ASFAuthenticationError(f'HTTP {response.status_code}: {response.text}')
+        response.raise_for_status()
+        with open(part_path, 'wb', buffering=DOWNLOAD_CHUNK_SIZE) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+    part_path.rename(out_path)
+    return out_path
+
+
+def download_raw_granule(
+    granule_name: str,
+    output_dir: Path,
+    unzip: bool = False,
+    session: asf_search.ASFSession | None = None,
+    result: asf_search.ASFProduct | None = None,
+) -> tuple[Path, BaseGeometry]:
     """Download a S1 granule using asf_search. Return its path
     and buffered extent.
 
@@ -124,33 +226,41 @@ def download_raw_granule(granule_name: str, output_dir: Path, unzip: bool = Fals
         granule_name: Name of the granule to download
         output_dir: Directory to save the granule in
         unzip: Unzip the granule if it is a zip file
+        session: Authenticated asf_search session to reuse (defaults to creating a new one)
+        result: Search result for the granule from `search_raw_granules` (defaults to searching for it)
 
     Returns:
         Tuple of the granule path and its extent as a Polygon
     """
-    username, password = get_earthdata_credentials()
-    session = asf_search.ASFSession().auth_with_creds(username, password)
+    if session is None:
+        session = get_earthdata_session()
     if not granule_name.endswith('-RAW'):
         granule_name += '-RAW'
 
-    result = asf_search.granule_search([granule_name])[0]
+    if result is None:
+        result = search_raw_granules([granule_name])[granule_name]
     bbox = shape(result.geojson()['geometry'])
 
     zip_path = output_dir / f'{granule_name[:-4]}.zip'
+    if zip_path.exists() and not is_zipfile(zip_path):
+        # A truncated zip left by an older download that wrote straight to the target rather than a .part file;
+        # an existing zip is otherwise reused without downloading it again
+        zip_path.unlink()
+
     if not unzip:
         out_path = zip_path
         if not out_path.exists():
-            result.download(path=output_dir, session=session)
+            download_asf_product(result, output_dir, session)
     else:
         out_path = output_dir / f'{granule_name[:-4]}.SAFE'
         if not out_path.exists() and not zip_path.exists():
-            result.download(path=output_dir, session=session)
+            download_asf_product(result, output_dir, session)
 
         if not out_path.exists():
             with ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall('.')
+                zip_ref.extractall(output_dir)
 
-        if zip_path.exists() and unzip:
+        if zip_path.exists():
             zip_path.unlink()
 
     return out_path, bbox
@@ -179,9 +289,7 @@ def create_param_file(dem_path: Path, dem_rsc_path: Path, output_dir: Path):
         dem_rsc_path: Path to the DEM RSC file
         output_dir: Directory to save the parameter file in
     """
-    lines = [str(dem_path), str(dem_rsc_path)]
-    with open(output_dir / 'params', 'w') as f:
-        f.write('\n'.join(lines))
+    (output_dir / 'params').write_text(f'{dem_path}\n{dem_rsc_path}\n')
 
 
 def call_stanford_module(local_name, args: list = [], work_dir: Path | None = None) -> None:
@@ -198,17 +306,75 @@ def call_stanford_module(local_name, args: list = [], work_dir: Path | None = No
     proc_home = get_proc_home()
     script = proc_home / local_name
     args = [str(x) for x in args]
-    print(f'Calling {local_name} {" ".join(args)} in directory {work_dir}')
+    log.info(f'Calling {local_name} {" ".join(args)} in directory {work_dir}')
     subprocess.run([script, *args], cwd=work_dir, check=True)
 
 
-def how_many_gpus():
-    """Get the number of GPUs available on the system using Stanford script."""
+def add_file_to_zip(
+    zip_file: ZipFile, path: Path, arcname: str | None = None, compress_type: int | None = None
+) -> None:
+    """Stream a file into an open zip archive using a large copy buffer.
+
+    `ZipFile.write` copies in 8 KiB chunks, which adds up to a lot of small reads and writes for multi-GB GSLCs.
+    Where supported, the kernel is also told the file will be read sequentially so it can read ahead aggressively.
+
+    Args:
+        zip_file: Zip archive opened for writing
+        path: Path to the file to add
+        arcname: Name of the file within the archive (defaults to the file name)
+        compress_type: Compression method for this file (defaults to the archive's compression method)
+    """
+    if arcname is None:
+        arcname = path.name
+    zip_info = ZipInfo.from_file(path, arcname)
+    zip_info.compress_type = zip_file.compression if compress_type is None else compress_type
+    with open(path, 'rb') as src, zip_file.open(zip_info, 'w') as dst:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        shutil.copyfileobj(src, dst, length=COPY_BUFFER_SIZE)
+
+
+def extract_zip(zip_path: Path, output_dir: Path) -> None:
+    """Extract the files in a flat zip archive, such as an SRG product, using a large copy buffer.
+
+    Args:
+        zip_path: Path to the zip archive
+        output_dir: Directory to extract the files into
+    """
+    with ZipFile(zip_path) as zip_file:
+        for member in zip_file.infolist():
+            if member.is_dir():
+                continue
+            with zip_file.open(member) as src, open(output_dir / Path(member.filename).name, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=COPY_BUFFER_SIZE)
+
+
+@functools.cache
+def how_many_gpus() -> int:
+    """Get the number of GPUs available on the system.
+
+    The count is fixed for the life of the process, so it is only looked up once.
+    """
     cmd = (get_proc_home() / 'sentinel' / 'howmanygpus').resolve()
-    proc = subprocess.Popen(str(cmd), stdout=subprocess.PIPE, shell=True)
-    (param, err) = proc.communicate()
-    ngpus = int(str(param, 'UTF-8').split()[0])
-    return ngpus
+    proc = subprocess.run([cmd], stdout=subprocess.PIPE, check=True)
+    return int(proc.stdout.split(maxsplit=1)[0])
+
+
+def gpu_available() -> bool:
+    """Check whether the GPU-based workflow can be used.
+
+    The `howmanygpus` executable is only built into the GPU container, so a missing executable means no GPU support.
+
+    Returns:
+        True if the Stanford GPU tooling is installed and reports at least one GPU
+    """
+    if not (get_proc_home() / 'sentinel' / 'howmanygpus').exists():
+        return False
+
+    try:
+        return how_many_gpus() > 0
+    except (subprocess.CalledProcessError, ValueError, IndexError):
+        return False
 
 
 def get_s3_args(uri: str, dest_dir: Path | None = None) -> tuple[str, str, Path]:
@@ -226,26 +392,25 @@ def get_s3_args(uri: str, dest_dir: Path | None = None) -> tuple[str, str, Path]
     if dest_dir is None:
         dest_dir = Path.cwd()
 
-    simple_s3_uri = Path(uri.replace('s3://', ''))
-    bucket = simple_s3_uri.parts[0]
-    key = '/'.join(simple_s3_uri.parts[1:])
-    out_path = dest_dir / simple_s3_uri.parts[-1]
+    bucket, _, key = uri.removeprefix('s3://').partition('/')
+    out_path = dest_dir / key.rpartition('/')[2]
     return bucket, key, out_path
 
 
-def s3_list_objects(bucket: str, prefix: str = '') -> dict:
-    """List objects in bucket at prefix
+def s3_list_objects(bucket: str, prefix: str = '') -> list[dict]:
+    """List all objects in bucket at prefix, following pagination
 
     Args:
         bucket: the simple s3 bucket name
         prefix: the path within the bucket to search
 
     Returns:
-        res: dictionary containing the response
+        objects: the `Contents` entries of every page of the response
     """
     bucket = bucket.replace('s3:', '').replace('/', '')
-    res = S3.list_objects(Bucket=bucket, Prefix=prefix)
-    return res
+    paginator = S3.get_paginator('list_objects_v2')
+    objects = [obj for page in paginator.paginate(Bucket=bucket, Prefix=prefix) for obj in page.get('Contents', [])]
+    return objects
 
 
 def download_from_s3(uri: str, dest_dir: Path | None = None) -> Path:
@@ -256,5 +421,23 @@ def download_from_s3(uri: str, dest_dir: Path | None = None) -> Path:
         dest_dir: the directory to place the downloaded file in
     """
     bucket, key, out_path = get_s3_args(uri, dest_dir)
-    S3.download_file(bucket, key, out_path)
+    S3.download_file(bucket, key, str(out_path), Config=S3_TRANSFER_CONFIG)
     return out_path
+
+
+def upload_file_to_s3(path_to_file: Path, bucket: str, prefix: str = '') -> None:
+    """Upload a file to an S3 bucket using large, concurrent multipart transfers.
+
+    Equivalent to `hyp3lib.aws.upload_file_to_s3`, but with a transfer config suited to multi-GB products.
+
+    Args:
+        path_to_file: Path to the file to upload
+        bucket: the s3 bucket to upload to
+        prefix: the path within the bucket to upload to
+    """
+    key = str(Path(prefix) / path_to_file.name)
+    extra_args = {'ContentType': get_content_type(key)}
+
+    log.info(f'Uploading s3://{bucket}/{key}')
+    S3.upload_file(str(path_to_file), bucket, key, ExtraArgs=extra_args, Config=S3_TRANSFER_CONFIG)
+    S3.put_object_tagging(Bucket=bucket, Key=key, Tagging=get_tag_set(path_to_file.name))
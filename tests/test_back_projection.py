@@ -1,3 +1,6 @@
+import sys
+import zipfile
+from pathlib import Path
 from unittest import mock
 
 import pytest
@@ -27,3 +30,118 @@ def test_back_project_granules(tmp_path, monkeypatch):
             work_dir=tmp_path,
         )
     assert not cleanup_file.exists()
+
+
+def test_create_product(tmp_path):
+    product_name = 'S1A_IW_SLC__1SDV_20231229T134339_20231229T134411_051870_064437_4F42'
+    (tmp_path / f'{product_name}.geo').write_bytes(b'\x00' * 16)
+    for f in [f'{product_name}.orbtiming', 'elevation.dem.rsc', 'bounds']:
+        (tmp_path / f).touch()
+    (tmp_path / 'S1A_IW_RAW__0SDV_20231229T134339_20231229T134411_051870_064437_4F42.SAFE').mkdir()
+
+    zip_path = back_projection.create_product(tmp_path)
+    assert zip_path == tmp_path / f'{product_name}.zip'
+    assert (tmp_path / f'{product_name}.txt').read_text() == (
+        'Process: back-projection\n'
+        'Input Granules: S1A_IW_RAW__0SDV_20231229T134339_20231229T134411_051870_064437_4F42\n'
+    )
+    with zipfile.ZipFile(zip_path) as z:
+        assert z.testzip() is None
+        assert z.namelist() == [
+            f'{product_name}.geo',
+            f'{product_name}.orbtiming',
+            'elevation.dem.rsc',
+            'bounds',
+            f'{product_name}.txt',
+        ]
+        assert z.getinfo(f'{product_name}.geo').compress_type == zipfile.ZIP_STORED
+        assert z.getinfo('elevation.dem.rsc').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_clean_up_after_back_projection(tmp_path):
+    to_remove = ['foo.hgt', 'dem.tif', 'DEMfoo', 'q.out', 'foo_positionburst_bar.tiff']
+    to_keep = ['elevation.dem', 'elevation.dem.rsc', 'params', 'S1A_foo.geo', '.hgt']
+    for f in to_remove + to_keep:
+        (tmp_path / f).touch()
+
+    back_projection.clean_up_after_back_projection(tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(to_keep)
+
+
+def test_download_granules(tmp_path, monkeypatch):
+    granules = ['granule1', 'granule2', 'granule3']
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'get_earthdata_session', mock.Mock())
+        m.setattr(utils, 'search_raw_granules', lambda names: {name: f'{name}_result' for name in names})
+        m.setattr(
+            utils,
+            'download_raw_granule',
+            lambda g, d, unzip, session, result: (d / f'{g}.SAFE', result.replace('result', 'bbox')),
+        )
+        m.setattr(utils, 'download_orbit', lambda g, d: d / f'{g}.EOF')
+        granule_orbit_pairs, bboxs = back_projection.download_granules(granules, tmp_path, max_workers=2)
+
+    assert granule_orbit_pairs == [(tmp_path / f'{g}.SAFE', tmp_path / f'{g}.EOF') for g in granules]
+    assert bboxs == [f'{g}_bbox' for g in granules]
+
+
+def test_back_project_granules_parallel(tmp_path, monkeypatch):
+    for f in ['elevation.dem', 'elevation.dem.rsc', 'params']:
+        (tmp_path / f).touch()
+    granule_orbit_pairs = [(tmp_path / f'S1_granule{i}.SAFE', tmp_path / f'orbit{i}.xml') for i in range(3)]
+    (tmp_path / 'scene_0').mkdir()
+
+    def call_stanford_module(cmd, args, work_dir):
+        assert work_dir.parent == tmp_path
+        assert work_dir.name.startswith('scene_')
+        assert (work_dir / 'params').resolve() == tmp_path / 'params'
+        (work_dir / f'{Path(args[0]).name}.geo').touch()
+        (work_dir / f'{Path(args[0]).name}.orbtiming').touch()
+        (work_dir / 'foo_positionburst_bar.tiff').touch()
+        (work_dir / 'shared.log').touch()
+
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'call_stanford_module', call_stanford_module)
+        back_projection.back_project_granules(granule_orbit_pairs, tmp_path, max_workers=2)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'S1_granule0.geo',
+        'S1_granule0.orbtiming',
+        'S1_granule1.geo',
+        'S1_granule1.orbtiming',
+        'S1_granule2.geo',
+        'S1_granule2.orbtiming',
+        'elevation.dem',
+        'elevation.dem.rsc',
+        'params',
+        'scene_0',
+    ]
+
+
+def test_back_project_granules_gpu_is_serial(tmp_path, monkeypatch):
+    for f in ['elevation.dem', 'elevation.dem.rsc', 'params']:
+        (tmp_path / f).touch()
+    granule_orbit_pairs = [(tmp_path / f'S1_granule{i}.SAFE', tmp_path / f'orbit{i}.xml') for i in range(2)]
+
+    with monkeypatch.context() as m:
+        m.setenv('CUDA_DEVICE_ORDER', '')
+        m.setenv('CUDA_VISIBLE_DEVICES', '')
+        mock_call_stanford_module = mock.Mock()
+        m.setattr(utils, 'call_stanford_module', mock_call_stanford_module)
+        back_projection.back_project_granules(granule_orbit_pairs, tmp_path, gpu=True, max_workers=2)
+
+    assert mock_call_stanford_module.call_count == 2
+    for call in mock_call_stanford_module.call_args_list:
+        assert call.args[0] == 'sentinel/sentinel_scene_multigpu.py'
+        assert call.kwargs['work_dir'] == tmp_path
+
+
+@pytest.mark.parametrize('option', ['--download-workers', '--processing-workers'])
+def test_main_rejects_non_positive_workers(option, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(sys, 'argv', ['back_projection', option, '0', 'granule'])
+        mock_back_project = mock.Mock()
+        m.setattr(back_projection, 'back_project', mock_back_project)
+        with pytest.raises(SystemExit):
+            back_projection.main()
+        mock_back_project.assert_not_called()
@@ -2,6 +2,7 @@ from pathlib import Path
 from unittest import mock
 
 import pytest
+import requests
 from shapely.geometry import box
 
 from hyp3_srg import dem, utils
@@ -37,3 +38,76 @@ def test_download_dem_for_srg(monkeypatch):
         for bbox in bad_bboxs:
             with pytest.raises(ValueError, match=r'Improper bounding box formatting*'):
                 dem.download_dem_for_srg(bbox, Path.cwd())
+
+
+def test_download_dem_for_srg_cached(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    def create_dem(bounds, output_dir):
+        for name in ['elevation.dem', 'elevation.dem.rsc', 'dem_tile.tif']:
+            (output_dir / name).write_text(name)
+
+    with monkeypatch.context() as m:
+        m.setenv('HYP3_SRG_DEM_CACHE', str(cache_dir))
+        mock_create_dem = mock.Mock(side_effect=create_dem)
+        m.setattr(dem, 'create_dem', mock_create_dem)
+        for _ in range(2):
+            assert dem.download_dem_for_srg([0.0, 1.0, 2.0, 3.0], work_dir) == work_dir / 'elevation.dem'
+        mock_create_dem.assert_called_once()
+
+    dem_dir = cache_dir / '0.0_1.0_2.0_3.0_6x2'
+    assert sorted(p.name for p in cache_dir.iterdir()) == [dem_dir.name]
+    assert sorted(p.name for p in dem_dir.iterdir()) == ['elevation.dem', 'elevation.dem.rsc']
+    assert dem_dir.stat().st_mode & 0o777 == 0o755
+    assert (work_dir / 'elevation.dem').resolve() == dem_dir / 'elevation.dem'
+    assert (work_dir / 'elevation.dem.rsc').read_text() == 'elevation.dem.rsc'
+    assert (work_dir / 'bounds').read_text() == '0.0 1.0 2.0 3.0'
+
+    with monkeypatch.context() as m:
+        m.delenv('HYP3_SRG_DEM_CACHE', raising=False)
+        m.setattr(dem, 'create_dem', create_dem)
+        dem.download_dem_for_srg([4.0, 5.0, 6.0, 7.0], work_dir)
+
+    assert not (work_dir / 'elevation.dem').is_symlink()
+    (work_dir / 'elevation.dem').write_text('other')
+    assert (dem_dir / 'elevation.dem').read_text() == 'elevation.dem'
+
+
+def test_ensure_egm_model_available(tmp_path, monkeypatch):
+    egm_model = bytes(range(256)) * 10
+    egm_model_path = tmp_path / 'DEM' / 'egm2008_geoid_grid'
+    egm_model_path.parent.mkdir()
+
+    def get(url, headers, stream):
+        assert url == dem.EGM_URL
+        start, end = (int(x) for x in headers['Range'].removeprefix('bytes=').split('-'))
+        response = mock.MagicMock(status_code=206)
+        response.__enter__.return_value.status_code = 206
+        response.__enter__.return_value.iter_content.return_value = [egm_model[start : end + 1]]
+        return response
+
+    with monkeypatch.context() as m:
+        m.setenv('PROC_HOME', str(tmp_path))
+        m.setattr(dem, 'EGM_PART_SIZE', 1000)
+        mock_session = mock.MagicMock()
+        mock_session.__enter__.return_value = mock_session
+        mock_session.head.return_value = mock.Mock(headers={'Content-Length': '2560'})
+        mock_get = mock.Mock(side_effect=get)
+        mock_session.get = mock_get
+        m.setattr(dem.requests, 'Session', mock.Mock(return_value=mock_session))
+
+        dem.ensure_egm_model_available()
+        assert mock_get.call_count == 3
+        assert egm_model_path.read_bytes() == egm_model
+        assert [path.name for path in egm_model_path.parent.iterdir()] == ['egm2008_geoid_grid']
+
+        dem.ensure_egm_model_available()
+        assert mock_get.call_count == 3
+
+        egm_model_path.unlink()
+        mock_session.get = mock.Mock(side_effect=requests.ConnectionError)
+        with pytest.raises(requests.ConnectionError):
+            dem.ensure_egm_model_available()
+        assert list(egm_model_path.parent.iterdir()) == []
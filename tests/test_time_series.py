@@ -1,4 +1,10 @@
-from hyp3_srg import time_series
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from hyp3_srg import time_series, utils
 
 
 def test_create_time_series_product_name():
@@ -39,3 +45,107 @@ def test_get_size_from_dem(tmp_path):
         rsc_file.write(rsc_content.strip())
     dem_width, dem_height = time_series.get_size_from_dem(dem_path=rsc_path)
     assert (dem_width, dem_height) == (1235, 873)
+
+    rsc_path.write_text('X_FIRST -124.41472222\nFILE_LENGTH 873\nWIDTH 1235\n')
+    assert time_series.get_size_from_dem(dem_path=rsc_path) == (1235, 873)
+
+
+def test_get_gslc_uris_from_s3(monkeypatch):
+    objects = [
+        {'Key': 'job/GSLC_granules/S1A_IW_RAW__0SDV_001_003_054532_06A2F8_8276.zip'},
+        {'Key': 'job/GSLC_granules/S1A_IW_RAW__0SDV_004_005_054882_06AF26_2CE5.zip'},
+        {'Key': 'job/GSLC_granules/'},
+        {'Key': 'job/GSLC_granules/S1A_IW_RAW__0SDV_004_005_054882_06AF26_2CE5.log'},
+        {'Key': 'job/GSLC_granules/S1_dir.zip/foo.txt'},
+    ]
+    with monkeypatch.context() as m:
+        m.setattr(utils, 's3_list_objects', mock.Mock(return_value=objects))
+        assert time_series.get_gslc_uris_from_s3('myBucket', 'job/GSLC_granules') == [
+            's3://myBucket/job/GSLC_granules/S1A_IW_RAW__0SDV_001_003_054532_06A2F8_8276.zip',
+            's3://myBucket/job/GSLC_granules/S1A_IW_RAW__0SDV_004_005_054882_06AF26_2CE5.zip',
+        ]
+
+
+def test_time_series_no_gslc_products(tmp_path, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(utils, 's3_list_objects', mock.Mock(return_value=[{'Key': 'job/GSLC_granules/'}]))
+        mock_call_stanford_module = mock.Mock()
+        m.setattr(utils, 'call_stanford_module', mock_call_stanford_module)
+        with pytest.raises(ValueError, match=r'No GSLC products found under s3://myBucket/job/GSLC_granules'):
+            time_series.time_series([], [0.0, 1.0, 2.0, 3.0], True, 'myBucket', 'job', tmp_path)
+        mock_call_stanford_module.assert_not_called()
+
+
+def test_fetch_product(tmp_path, monkeypatch):
+    with monkeypatch.context() as m:
+        mock_download_from_s3 = mock.Mock()
+        m.setattr(utils, 'download_from_s3', mock_download_from_s3)
+        assert time_series.fetch_product('s3://foo/bar/granule.zip', tmp_path)
+        mock_download_from_s3.assert_called_once_with('s3://foo/bar/granule.zip', dest_dir=tmp_path)
+
+        (tmp_path / 'granule.geo').touch()
+        assert not time_series.fetch_product('s3://foo/bar/granule.zip', tmp_path)
+        mock_download_from_s3.assert_called_once()
+
+        assert time_series.fetch_product('s3://foo/bar/granule.zip', tmp_path, overwrite=True)
+        assert mock_download_from_s3.call_count == 2
+
+
+def test_load_product(tmp_path, monkeypatch):
+    def fake_download_from_s3(uri, dest_dir):
+        with zipfile.ZipFile(dest_dir / 'granule.zip', 'w') as z:
+            z.writestr('granule.geo', b'geo')
+            z.writestr('granule.orbtiming', b'orbtiming')
+
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'download_from_s3', fake_download_from_s3)
+        assert time_series.load_product('s3://foo/bar/granule.zip', tmp_path) == 'granule.zip'
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['granule.geo', 'granule.orbtiming']
+
+
+def test_load_products(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    uris = ['s3://foo/granule.zip', 's3://bar/granule.zip', 's3://foo/other.zip']
+    with monkeypatch.context() as m:
+        mock_load_product = mock.Mock(side_effect=lambda uri, work_dir, overwrite: Path(uri).name)
+        m.setattr(time_series, 'load_product', mock_load_product)
+        assert time_series.load_products(uris) == ['granule.zip', 'granule.zip', 'other.zip']
+
+    assert sorted(call.args[0] for call in mock_load_product.call_args_list) == [
+        's3://foo/granule.zip',
+        's3://foo/other.zip',
+    ]
+
+
+def test_compute_sbas_velocity_solution(tmp_path, monkeypatch):
+    (tmp_path / 'intlist').write_text('a.int\nb.int\n')
+    (tmp_path / 'geolist').write_text('a.geo\nb.geo\nc.geo\n')
+    with monkeypatch.context() as m:
+        mock_call_stanford_module = mock.Mock()
+        m.setattr(utils, 'call_stanford_module', mock_call_stanford_module)
+        time_series.compute_sbas_velocity_solution(0.5, False, (100, 50), tmp_path)
+
+    assert (tmp_path / 'unwlist').read_text() == 'a.unw\nb.unw\n'
+    mock_call_stanford_module.assert_called_with(
+        'sbas/sbas', args=['unwlist', 2, 3, 100, 'ref_locs'], work_dir=tmp_path
+    )
+
+
+def test_package_time_series(tmp_path):
+    sbas_dir = tmp_path / 'sbas'
+    sbas_dir.mkdir()
+    names = ['sbas_list', 'parameters', 'ref_locs', 'dem.rsc', 'dem', 'locs', 'npts']
+    names += ['displacement', 'stackmht', 'stacktime', 'velocity']
+    for name in names:
+        (sbas_dir / name).write_text(name)
+
+    granule_names = ['S1A_IW_RAW__0SDV_001_003_054532_06A2F8_8276', 'S1A_IW_RAW__0SDV_004_005_054882_06AF26_2CE5']
+    zip_path = time_series.package_time_series(granule_names, [-100.0, 45.0, -90.0, 50.0], tmp_path)
+
+    assert zip_path.parent == tmp_path
+    with zipfile.ZipFile(zip_path) as z:
+        assert z.testzip() is None
+        assert sorted(z.namelist()) == sorted(names)
+        assert z.getinfo('parameters').compress_type == zipfile.ZIP_DEFLATED
+        assert z.getinfo('velocity').compress_type == zipfile.ZIP_STORED
@@ -1,5 +1,6 @@
 import os
 import subprocess
+import zipfile
 from pathlib import Path
 from unittest import mock
 
@@ -15,8 +16,7 @@ def test_create_param_file(tmp_path):
     utils.create_param_file(dem_path, dem_rsc_path, output_dir)
     assert (tmp_path / 'params').exists()
 
-    with open(tmp_path / 'params') as f:
-        lines = [x.strip() for x in f.readlines()]
+    lines = (tmp_path / 'params').read_text().splitlines()
 
     assert len(lines) == 2
     assert lines[0] == str(dem_path)
@@ -80,6 +80,37 @@ def test_find_creds_in_netrc(tmp_path, monkeypatch):
         (tmp_path / '.netrc').write_text('')
         assert utils.find_creds_in_netrc('test') == (None, None)
 
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'get_netrc', lambda: tmp_path / '.netrc')
+        (tmp_path / '.netrc').write_text('machine test login foo password bar')
+        mock_netrc = mock.Mock(wraps=utils.netrc.netrc)
+        m.setattr(utils.netrc, 'netrc', mock_netrc)
+        utils._parse_netrc.cache_clear()
+        assert utils.find_creds_in_netrc('test') == ('foo', 'bar')
+        assert utils.find_creds_in_netrc('test') == ('foo', 'bar')
+        mock_netrc.assert_called_once()
+
+
+def test_get_earthdata_credentials(tmp_path, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'get_netrc', lambda: tmp_path / '.netrc')
+        m.delenv('EARTHDATA_USERNAME', raising=False)
+        m.delenv('EARTHDATA_PASSWORD', raising=False)
+        utils.set_creds('EARTHDATA', 'foo', 'bar')
+        assert utils.get_earthdata_credentials() == ('foo', 'bar')
+
+        m.setenv('EARTHDATA_USERNAME', 'baz')
+        assert utils.get_earthdata_credentials() == ('foo', 'bar')
+
+        utils.set_creds('EARTHDATA', 'baz', 'qux')
+        assert utils.get_earthdata_credentials() == ('baz', 'qux')
+
+        m.delenv('EARTHDATA_USERNAME')
+        m.delenv('EARTHDATA_PASSWORD')
+        utils.set_creds('EARTHDATA', None, None)
+        with pytest.raises(ValueError, match=r'Please provide NASA EarthData credentials*'):
+            utils.get_earthdata_credentials()
+
 
 def test_call_stanford_module(monkeypatch):
     with monkeypatch.context() as m:
@@ -90,6 +121,51 @@ def test_call_stanford_module(monkeypatch):
         mock_run.assert_called_once_with([Path('foo/bar.py'), 'arg1', 'arg2'], cwd=Path.cwd(), check=True)
 
 
+def test_add_file_to_zip(tmp_path):
+    data_file = tmp_path / 'foo.geo'
+    data_file.write_bytes(b'\x00\x01' * 1024)
+    zip_path = tmp_path / 'foo.zip'
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as z:
+        utils.add_file_to_zip(z, data_file)
+        utils.add_file_to_zip(z, data_file, 'bar/foo.geo', compress_type=zipfile.ZIP_DEFLATED)
+
+    with zipfile.ZipFile(zip_path) as z:
+        assert z.testzip() is None
+        assert z.namelist() == ['foo.geo', 'bar/foo.geo']
+        assert z.getinfo('foo.geo').compress_type == zipfile.ZIP_STORED
+        assert z.getinfo('bar/foo.geo').compress_type == zipfile.ZIP_DEFLATED
+        assert z.read('bar/foo.geo') == data_file.read_bytes()
+
+
+def test_extract_zip(tmp_path):
+    zip_path = tmp_path / 'granule.zip'
+    with zipfile.ZipFile(zip_path, 'w') as zip_file:
+        zip_file.writestr('granule/', '')
+        zip_file.writestr('granule/granule.geo', b'geo')
+        zip_file.writestr('granule.orbtiming', b'orbtiming')
+
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    utils.extract_zip(zip_path, output_dir)
+    assert sorted(path.name for path in output_dir.iterdir()) == ['granule.geo', 'granule.orbtiming']
+    assert (output_dir / 'granule.geo').read_bytes() == b'geo'
+
+
+def test_how_many_gpus(monkeypatch):
+    with monkeypatch.context() as m:
+        mock_run = mock.Mock(return_value=subprocess.CompletedProcess([], 0, stdout=b'2\n'))
+        m.setattr(subprocess, 'run', mock_run)
+        m.setenv('PROC_HOME', '.')
+        utils.how_many_gpus.cache_clear()
+        assert utils.how_many_gpus() == 2
+        assert utils.how_many_gpus() == 2
+        mock_run.assert_called_once_with(
+            [(Path('.') / 'sentinel' / 'howmanygpus').resolve()], stdout=subprocess.PIPE, check=True
+        )
+
+    utils.how_many_gpus.cache_clear()
+
+
 def test_get_s3_args():
     s3_uri_1 = 's3://foo/bar.zip'
     s3_uri_2 = 's3://foo/bing/bong/bar.zip'
@@ -100,3 +176,158 @@ def test_get_s3_args():
         'bing/bong/bar.zip',
         dest_dir / 'bar.zip',
     )
+
+
+def test_gpu_available(tmp_path, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setenv('PROC_HOME', str(tmp_path))
+        mock_how_many_gpus = mock.Mock(return_value=1)
+        m.setattr(utils, 'how_many_gpus', mock_how_many_gpus)
+        assert not utils.gpu_available()
+        mock_how_many_gpus.assert_not_called()
+
+        (tmp_path / 'sentinel').mkdir()
+        (tmp_path / 'sentinel' / 'howmanygpus').touch()
+        assert utils.gpu_available()
+
+        mock_how_many_gpus.return_value = 0
+        assert not utils.gpu_available()
+
+        mock_how_many_gpus.side_effect = subprocess.CalledProcessError(1, 'howmanygpus')
+        assert not utils.gpu_available()
+
+
+def test_upload_file_to_s3(tmp_path, monkeypatch):
+    product = tmp_path / 'foo.zip'
+    product.touch()
+    with monkeypatch.context() as m:
+        mock_s3 = mock.Mock()
+        m.setattr(utils, 'S3', mock_s3)
+        utils.upload_file_to_s3(product, 'myBucket', 'myPrefix')
+        mock_s3.upload_file.assert_called_once_with(
+            str(product),
+            'myBucket',
+            'myPrefix/foo.zip',
+            ExtraArgs={'ContentType': 'application/zip'},
+            Config=utils.S3_TRANSFER_CONFIG,
+        )
+        mock_s3.put_object_tagging.assert_called_once_with(
+            Bucket='myBucket', Key='myPrefix/foo.zip', Tagging={'TagSet': [{'Key': 'file_type', 'Value': 'product'}]}
+        )
+
+
+def test_download_raw_granule_replaces_partial_zip(tmp_path, monkeypatch):
+    granule = 'S1A_IW_RAW__0SDV_20231229T134339_20231229T134411_051870_064437_4F42'
+    zip_path = tmp_path / f'{granule}.zip'
+    zip_path.write_bytes(b'PK\x03\x04truncated')
+
+    def download(result, output_dir, session):
+        with zipfile.ZipFile(output_dir / f'{granule}.zip', 'w') as z:
+            z.writestr('manifest.safe', '')
+
+    mock_result = mock.Mock(properties={'fileID': f'{granule}-RAW'})
+    mock_result.geojson.return_value = {'geometry': {'type': 'Point', 'coordinates': [0, 0]}}
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'get_earthdata_credentials', lambda: ('foo', 'bar'))
+        m.setattr(utils.asf_search, 'ASFSession', mock.Mock())
+        m.setattr(utils.asf_search, 'granule_search', mock.Mock(return_value=[mock_result]))
+        mock_download = mock.Mock(side_effect=download)
+        m.setattr(utils, 'download_asf_product', mock_download)
+        assert utils.download_raw_granule(granule, tmp_path)[0] == zip_path
+        mock_download.assert_called_once()
+        assert zipfile.is_zipfile(zip_path)
+
+        utils.download_raw_granule(granule, tmp_path)
+        mock_download.assert_called_once()
+
+
+def test_download_raw_granule_unzip(tmp_path, monkeypatch):
+    granule = 'S1A_IW_RAW__0SDV_20231229T134339_20231229T134411_051870_064437_4F42'
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    def download(result, output_dir, session):
+        with zipfile.ZipFile(output_dir / f'{granule}.zip', 'w') as z:
+            z.writestr(f'{granule}.SAFE/manifest.safe', '')
+
+    mock_result = mock.Mock(properties={'fileID': f'{granule}-RAW'})
+    mock_result.geojson.return_value = {'geometry': {'type': 'Point', 'coordinates': [0, 0]}}
+    with monkeypatch.context() as m:
+        m.setattr(utils, 'download_asf_product', mock.Mock(side_effect=download))
+        safe_path, _ = utils.download_raw_granule(
+            granule, output_dir, unzip=True, session=mock.Mock(), result=mock_result
+        )
+
+    assert safe_path == output_dir / f'{granule}.SAFE'
+    assert (safe_path / 'manifest.safe').exists()
+    assert not (output_dir / f'{granule}.zip').exists()
+    assert not (tmp_path / f'{granule}.SAFE').exists()
+
+
+def test_download_asf_product(tmp_path):
+    result = mock.Mock(properties={'fileName': 'foo.zip', 'url': 'https://example.com/foo.zip'})
+    session = mock.MagicMock()
+    response = session.get.return_value.__enter__.return_value
+    response.status_code = 200
+    response.iter_content.return_value = [b'foo', b'bar']
+
+    assert utils.download_asf_product(result, tmp_path, session) == tmp_path / 'foo.zip'
+    assert (tmp_path / 'foo.zip').read_bytes() == b'foobar'
+    assert not (tmp_path / 'foo.zip.part').exists()
+    response.iter_content.assert_called_once_with(chunk_size=utils.DOWNLOAD_CHUNK_SIZE)
+
+    response.status_code = 401
+    response.text = 'Unauthorized'
+    with pytest.raises(utils.asf_search.ASFAuthenticationError, match=r'HTTP 401: Unauthorized'):
+        utils.download_asf_product(result, tmp_path, session)
+
+
+def test_strip_auth_if_aws():
+    response = mock.Mock(status_code=307, headers={'location': 'https://bucket.s3.amazonaws.com/foo', 'Auth': 'x'})
+    utils._strip_auth_if_aws(response)
+    assert response.headers == {'location': 'https://bucket.s3.amazonaws.com/foo'}
+
+    response = mock.Mock(status_code=307, headers={'location': 'https://example.com/foo', 'Auth': 'x'})
+    utils._strip_auth_if_aws(response)
+    assert response.headers == {'location': 'https://example.com/foo', 'Auth': 'x'}
+
+
+def test_search_raw_granules(monkeypatch):
+    results = [mock.Mock(properties={'fileID': f'granule{i}-RAW'}) for i in range(2)]
+    with monkeypatch.context() as m:
+        mock_granule_search = mock.Mock(return_value=results[::-1])
+        m.setattr(utils.asf_search, 'granule_search', mock_granule_search)
+        assert utils.search_raw_granules(['granule0', 'granule1-RAW']) == {
+            'granule0': results[0],
+            'granule1-RAW': results[1],
+        }
+        mock_granule_search.assert_called_once_with(['granule0-RAW', 'granule1-RAW'])
+
+        with pytest.raises(ValueError, match=r'Could not find granule\(s\): granule2'):
+            utils.search_raw_granules(['granule0', 'granule2'])
+
+
+def test_download_from_s3(tmp_path, monkeypatch):
+    with monkeypatch.context() as m:
+        mock_s3 = mock.Mock()
+        m.setattr(utils, 'S3', mock_s3)
+        assert utils.download_from_s3('s3://foo/bar/granule.zip', tmp_path) == tmp_path / 'granule.zip'
+        mock_s3.download_file.assert_called_once_with(
+            'foo', 'bar/granule.zip', str(tmp_path / 'granule.zip'), Config=utils.S3_TRANSFER_CONFIG
+        )
+
+
+def test_s3_list_objects(monkeypatch):
+    pages = [{'Contents': [{'Key': 'foo/a.zip'}, {'Key': 'foo/b.zip'}]}, {'Contents': [{'Key': 'foo/c.zip'}]}, {}]
+    with monkeypatch.context() as m:
+        mock_s3 = mock.Mock()
+        mock_s3.get_paginator.return_value.paginate.return_value = pages
+        m.setattr(utils, 'S3', mock_s3)
+        assert utils.s3_list_objects('s3://myBucket/', 'foo') == [
+            {'Key': 'foo/a.zip'},
+            {'Key': 'foo/b.zip'},
+            {'Key': 'foo/c.zip'},
+        ]
+        mock_s3.get_paginator.assert_called_once_with('list_objects_v2')
+        mock_s3.get_paginator.return_value.paginate.assert_called_once_with(Bucket='myBucket', Prefix='foo')